@@ -4,14 +4,21 @@ from __future__ import annotations
 import typing
 import enum
 import arrow
+import arrow.parser
 import abc
+import array
+import collections
 import string
 import datetime
 import random
+import threading
 import functools
 import inspect
+import itertools
 import json
+import sys
 import traceback
+from time import monotonic_ns as _now_ns, time_ns as _wall_ns
 
 class Status(enum.Enum):
     Unknown = 0
@@ -26,9 +33,49 @@ status_to_emoji = {
     Status.Succeed: "👍"
 }
 
+class Outcome(enum.IntEnum):
+    Started = 0
+    Succeeded = 1
+    Failed = 2
+
+outcome_to_key = {
+    Outcome.Started: 'outcome.hasStarted',
+    Outcome.Succeeded: 'outcome.hasSucceeded',
+    Outcome.Failed: 'outcome.hasFailed'
+}
+
+_zero_counters = array.array('q', [0] * len(Outcome))
+
 tally_var_name = '__tally__'
 
+# set to True to give tasks random ids instead of sequential ones, e.g. when merging logs of several processes
+random_task_ids = False
+_next_task_id = itertools.count().__next__
+
+# number of yielded values a generator task buffers before passing them to its listeners' on_yields
+yield_batch_size = 64
+
+# offset between the monotonic clock used for timing and the wall clock used for display
+_epoch_offset_ns = _wall_ns() - _now_ns()
+
+def _ns_to_datetime(ns: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp((ns + _epoch_offset_ns) / 1e9)
+
+def _parse_datetime(text: str) -> datetime.datetime:
+    # keeps an explicit UTC offset; strings without one stay naive and are read as local time
+    return arrow.parser.DateTimeParser().parse_iso(text)
+
+def _datetime_to_ns(dt: datetime.datetime) -> int:
+    return int(dt.timestamp() * 1e9) - _epoch_offset_ns
+
+def _inc(counts: typing.Dict[str, int|float], key: str, amount: int|float = 1):
+    try:
+        counts[key] += amount
+    except KeyError:
+        counts[key] = amount
+
 class Scope:
+    __slots__ = ('kind', 'name')
     kind: str
     name: str
 
@@ -40,6 +87,10 @@ class Scope:
         return self.name
 
 class Monitor:
+    __slots__ = ()
+    # set to True on monitors that read Task.args/kwargs; otherwise they are only captured when logging
+    wants_args: bool = False
+
     @abc.abstractmethod
     def reset(self):
         pass
@@ -52,6 +103,10 @@ class Monitor:
     def on_yield(self, task: Task):
         pass
 
+    def on_yields(self, task: Task, batch: typing.List[typing.Any]):
+        for value in batch:
+            self.on_yield(task)
+
     @abc.abstractmethod
     def on_success(self, task: Task):
         pass
@@ -60,72 +115,244 @@ class Monitor:
     def on_failure(self, task: Task):
         pass
 
+    def on_skip(self):
+        pass
+
+    def local(self) -> Monitor:
+        return self
+
 class Tally(Monitor):
+    __slots__ = (
+        'scopes', '_scope_prefix', 'start_time_ns', 'consumed', 'pending', '_listeners',
+        '_on_start_cbs', '_on_yield_cbs', '_on_yields_cbs', '_on_success_cbs', '_on_failure_cbs', '_on_skip_cbs',
+        '_listeners_want_args'
+    )
     scopes: typing.List[Scope]
-    start_time: datetime.datetime
-    consumed: typing.Dict[ str, int|float ]
-    pending: typing.Set[ Task ]
-    listeners: typing.List[ Monitor ]
+    _scope_prefix: str
+    start_time_ns: int
+    consumed: typing.Counter[ str ]
+    pending: typing.Dict[ str, Task ]
+    _listeners: typing.Tuple[ Monitor, ... ]
+    # bound callbacks of listeners, rebuilt whenever listeners is assigned so events skip the per-listener method lookup
+    _on_start_cbs: typing.Tuple[ typing.Callable[ [Task], typing.Any ], ... ]
+    _on_yield_cbs: typing.Tuple[ typing.Callable[ [Task], typing.Any ], ... ]
+    _on_yields_cbs: typing.Tuple[ typing.Callable[ [Task, typing.List[typing.Any]], typing.Any ], ... ]
+    _on_success_cbs: typing.Tuple[ typing.Callable[ [Task], typing.Any ], ... ]
+    _on_failure_cbs: typing.Tuple[ typing.Callable[ [Task], typing.Any ], ... ]
+    _on_skip_cbs: typing.Tuple[ typing.Callable[ [], typing.Any ], ... ]
+    _listeners_want_args: bool
 
     def __init__(self, *scopes: Scope):
         self.scopes = list(scopes)
-        self.start_time = datetime.datetime.now()
-        self.consumed = {}
-        self.pending = set()
-        self.listeners = []
+        self._scope_prefix = ''.join([ str(scope) + '.' for scope in self.scopes ])
+        self.start_time_ns = _now_ns()
+        self.consumed = collections.Counter()
+        self.pending = {}
+        self.listeners = ()
 
     def __str__(self):
         return '.'.join([ str(scope) for scope in self.scopes])
 
+    @property
+    def start_time(self) -> datetime.datetime:
+        return _ns_to_datetime(self.start_time_ns)
+
+    @property
+    def listeners(self) -> typing.Tuple[ Monitor, ... ]:
+        return self._listeners
+
+    @listeners.setter
+    def listeners(self, listeners: typing.Iterable[ Monitor ]):
+        # stored as a tuple so that in-place changes fail loudly instead of bypassing _bind_listeners
+        self._listeners = tuple(listeners)
+        self._bind_listeners()
+
+    def _bind_listeners(self):
+        self._on_start_cbs = tuple([ listener.on_start for listener in self.listeners ])
+        self._on_yield_cbs = tuple([ listener.on_yield for listener in self.listeners ])
+        self._on_yields_cbs = tuple([
+            getattr(listener, 'on_yields', None) or functools.partial(Monitor.on_yields, listener)
+            for listener in self.listeners
+        ])
+        self._on_success_cbs = tuple([ listener.on_success for listener in self.listeners ])
+        self._on_failure_cbs = tuple([ listener.on_failure for listener in self.listeners ])
+        self._on_skip_cbs = tuple([ listener.on_skip for listener in self.listeners if hasattr(listener, 'on_skip') ])
+        self._listeners_want_args = any(getattr(listener, 'wants_args', False) for listener in self.listeners)
+
+    @property
+    def wants_args(self) -> bool:
+        # a property rather than a slot, so subclasses can still set wants_args = True at class level
+        return self._listeners_want_args
+
     def notifies(self, listener: Monitor):
-        self.listeners.append(listener)
+        self.listeners = self._listeners + (listener,)
         return self
 
     def reset(self):
-        self.consumed = {}
-        self.pending = set()
-        self.start_time = datetime.datetime.now()
+        self.consumed = collections.Counter()
+        self.pending = {}
+        self.start_time_ns = _now_ns()
         return self
 
     def on_start(self, task: Task):
-        for listener in self.listeners:
-            listener.on_start(task)
-        self.pending.add(task)
+        for callback in self._on_start_cbs:
+            callback(task)
+        self.pending[task.id_] = task
         return self
 
     def on_yield(self, task: Task):
-        for listener in self.listeners:
-            listener.on_yield(task)
+        for callback in self._on_yield_cbs:
+            callback(task)
+        return self
+
+    def on_yields(self, task: Task, batch: typing.List[typing.Any]):
+        if type(self).on_yield is not Tally.on_yield:
+            # a subclass hooks on_yield, so keep calling it once per item
+            return Monitor.on_yields(self, task, batch)
+        for callback in self._on_yields_cbs:
+            callback(task, batch)
         return self
 
     def on_success(self, task: Task):
-        for listener in self.listeners:
-            listener.on_success(task)
-        self.pending.remove(task)
-        for key in task.consumed.keys():
-            self.consumed[key] = (self.consumed.get(key) or 0) + task.consumed[key]
+        for callback in self._on_success_cbs:
+            callback(task)
+        self.pending.pop(task.id_, None)
+        for outcome, count in enumerate(task._counters):
+            if count:
+                self.consumed[outcome_to_key[outcome]] += count
+        if task.consumed:
+            self.consumed.update(task.consumed)
         return self
 
     def on_failure(self, task: Task):
-        for listener in self.listeners:
-            listener.on_failure(task)
-        self.pending.remove(task)
-        for key in task.consumed.keys():
-            self.consumed[key] = (self.consumed.get(key) or 0) + task.consumed[key]
+        for callback in self._on_failure_cbs:
+            callback(task)
+        self.pending.pop(task.id_, None)
+        for outcome, count in enumerate(task._counters):
+            if count:
+                self.consumed[outcome_to_key[outcome]] += count
+        if task.consumed:
+            self.consumed.update(task.consumed)
+        return self
+
+    def on_skip(self):
+        for callback in self._on_skip_cbs:
+            callback()
+        self.consumed['outcome.hasSkipped'] += 1
         return self
 
     def to_json(self) -> typing.Dict[str, typing.Any]:
-        seconds = (datetime.datetime.now() - self.start_time).total_seconds()
+        seconds = (_now_ns() - self.start_time_ns) / 1e9
         result = {}
-        for key in self.consumed.keys():
-            tag = '.'.join([ str(scope) for scope in self.scopes ] + [key])
-            result[tag] = {
-                'count': self.consumed.get(key),
-                'perSecond': self.consumed.get(key) / seconds
+        prefix = self._scope_prefix
+        for key, count in self.consumed.items():
+            result[prefix + key] = {
+                'count': count,
+                'perSecond': count / seconds
             }
         return result
 
+class ShardedTally(Monitor):
+    """Tally that counts into a separate child Tally per thread and sums them on demand"""
+    __slots__ = ('scopes', '_listeners', '_local', '_shards', '_lock')
+    scopes: typing.List[Scope]
+    _listeners: typing.Tuple[ Monitor, ... ]
+    _local: threading.local
+    _shards: typing.List[Tally]
+    _lock: threading.Lock
+
+    def __init__(self, *scopes: Scope):
+        self.scopes = list(scopes)
+        self._listeners = ()
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return '.'.join([ str(scope) for scope in self.scopes])
+
+    def local(self) -> Tally:
+        try:
+            return self._local.tally
+        except AttributeError:
+            shard = Tally(*self.scopes)
+            with self._lock:
+                shard.listeners = self._listeners
+                self._shards.append(shard)
+            self._local.tally = shard
+            return shard
+
+    @property
+    def listeners(self) -> typing.Tuple[ Monitor, ... ]:
+        return self._listeners
+
+    @property
+    def wants_args(self) -> bool:
+        return any(getattr(listener, 'wants_args', False) for listener in self._listeners)
+
+    def notifies(self, listener: Monitor):
+        with self._lock:
+            self._listeners = self._listeners + (listener,)
+            for shard in self._shards:
+                shard.notifies(listener)
+        return self
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.reset()
+        return self
+
+    def on_start(self, task: Task):
+        self.local().on_start(task)
+        return self
+
+    def on_yield(self, task: Task):
+        self.local().on_yield(task)
+        return self
+
+    def on_yields(self, task: Task, batch: typing.List[typing.Any]):
+        self.local().on_yields(task, batch)
+        return self
+
+    def on_success(self, task: Task):
+        self.local().on_success(task)
+        return self
+
+    def on_failure(self, task: Task):
+        self.local().on_failure(task)
+        return self
+
+    def on_skip(self):
+        self.local().on_skip()
+        return self
+
+    def aggregate(self) -> Tally:
+        with self._lock:
+            shards = list(self._shards)
+        result = Tally(*self.scopes)
+        for shard in shards:
+            # copy first, the owning thread may add keys while we merge
+            result.consumed.update(dict(shard.consumed))
+            result.pending.update(dict(shard.pending))
+            result.start_time_ns = min(result.start_time_ns, shard.start_time_ns)
+        return result
+
+    def to_json(self) -> typing.Dict[str, typing.Any]:
+        return self.aggregate().to_json()
+
+def _func_name(func) -> str:
+    if hasattr(func, 'im_class'):
+        return func.im_class.__name__ + '.'
+    elif hasattr(func, '__qualname__'):
+        return func.__qualname__
+    elif hasattr(func, '__name__'):
+        return func.__name__
+    return ''
+
 class Call:
+    __slots__ = ('func', 'stack_entry', 'purpose', 'filename', 'lineno')
+
     def __init__(self, stack_entry, func=None):
         self.func = func
         self.stack_entry = stack_entry
@@ -134,17 +361,11 @@ class Call:
         self.lineno = None
 
     def inspect(self):
-        caller = inspect.getframeinfo(self.stack_entry)
-        self.filename = caller.filename.split('/')[-1]
-        self.lineno = caller.lineno
-        self.purpose = '%s.%d: ' % (self.filename,caller.lineno)
-        if hasattr(self.func, 'im_class'):
-            self.purpose += self.func.im_class.__name__
-            self.purpose += '.'
-        elif hasattr(self.func, '__qualname__'):
-            self.purpose += self.func.__qualname__
-        elif hasattr(self.func, '__name__'):
-            self.purpose += self.func.__name__
+        caller = self.stack_entry
+        self.filename = caller.f_code.co_filename.rsplit('/', 1)[-1]
+        self.lineno = caller.f_lineno
+        self.purpose = '%s.%d: ' % (self.filename,self.lineno)
+        self.purpose += _func_name(self.func)
 
     def get_filename(self):
         if self.filename is None:
@@ -162,13 +383,20 @@ class Call:
         return self.purpose
 
 class Task:
+    __slots__ = (
+        'id_', 'parent_id', 'purpose', 'start_time', 'end_time', 'status',
+        'consumed', '_counters', 'tags', 'listeners',
+        'warnings', 'errors', 'args', 'kwargs', 'return_value', 'exception',
+        'json_formatter', 'logger', 'log_enable', '_wants_args', '_yield_buffer', '_yield_sampling'
+    )
     id_: str
     parent_id: typing.Union[ str, None ]
-    purpose: typing.Union[str, None]
-    start_time: typing.Union[datetime.datetime, None]
-    end_time: typing.Union[datetime.datetime, None]
-    status: Status = Status.Unknown
+    purpose: typing.Union[str, Call, None]
+    start_time: typing.Union[int, None]
+    end_time: typing.Union[int, None]
+    status: Status
     consumed: typing.Dict[ str, int|float ]
+    _counters: array.array
     tags: typing.Set[ str ]
     listeners: typing.List[ Monitor ]
 
@@ -182,20 +410,27 @@ class Task:
     json_formatter: typing.Union[typing.Callable[ [typing.Any], typing.Any ], None]
     logger: typing.Union[ typing.Callable[ [str], None ], None ]
     log_enable: typing.Union[ typing.Callable[ [], bool ], None ]
+    _wants_args: bool
+    _yield_buffer: typing.Union[typing.List[typing.Any], None]
+    _yield_sampling: typing.Union[int, None]
 
     def __init__(self,
-        purpose: str=None,
+        purpose: typing.Union[str, Call]=None,
         parent: Task=None,
         logger: typing.Union[ typing.Callable[ [str], None ], None ]=None
     ):
         self.purpose = purpose
         self.parent_id = None if parent is None else parent.id_
-        self.id_ = ''.join(random.choices(string.ascii_uppercase + string.digits, k=7))
+        if random_task_ids:
+            self.id_ = ''.join(random.choices(string.ascii_uppercase + string.digits, k=7))
+        else:
+            self.id_ = format(_next_task_id(), '07X')
 
         self.start_time = None
         self.end_time = None
         self.status = Status.Unknown
         self.consumed = {}
+        self._counters = _zero_counters[:]
         self.tags = set()
         self.listeners = []
 
@@ -210,65 +445,95 @@ class Task:
         self.json_formatter = None
         self.logger = logger
         self.log_enable = None
+        self._wants_args = False
+        self._yield_buffer = None
+        self._yield_sampling = None
 
     def to_log_line(self, verb: str, body: str = None) -> str:
-        return f"{status_to_emoji[self.status]} {self.id_} {verb}{body or self.purpose}"
+        return f"{status_to_emoji[self.status]} {self.id_} {verb}{body or str(self.purpose)}"
 
     def notifies(self, listener: Monitor):
-        self.listeners.append(listener)
+        # listeners need not subclass Monitor, so only resolve local() where it exists
+        local = getattr(listener, 'local', None)
+        self.listeners.append(listener if local is None else local())
+        if getattr(listener, 'wants_args', False):
+            self._wants_args = True
         return self
 
     def on_start(self):
-        self.start_time = datetime.datetime.now()
+        self.start_time = _now_ns()
         self.status = Status.Run
-        self.consumed['outcome.hasStarted'] = (self.consumed.get('outcome.hasStarted') or 0) + 1
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None:
+        self._counters[Outcome.Started] += 1
+        if self.logger is not None and (self.log_enable is None or self.log_enable()):
+            use_logger = self.logger
             use_logger(self.to_log_line('BEGIN '))
             if self.args is not None:
                 use_logger(self.to_log_line('ARGS  ', json.dumps(self.args, default=str)))
             if self.kwargs is not None:
                 use_logger(self.to_log_line('KWARGS ', json.dumps(self.kwargs, default=str)))
-        for listener in self.listeners:
-            listener.on_start(self)
+        if self.listeners:
+            for listener in self.listeners:
+                listener.on_start(self)
         return self
 
     def on_yield(self, value):
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None and value is not None:
-            use_logger(self.to_log_line('YIELD ', json.dumps(value, default=str)))
-        for listener in self.listeners:
-            listener.on_yield(self)
+        if self.logger is not None and value is not None and (self.log_enable is None or self.log_enable()):
+            self.logger(self.to_log_line('YIELD ', json.dumps(value, default=str)))
+        if self.listeners:
+            if self._yield_buffer is None:
+                self._yield_buffer = []
+            self._yield_buffer.append(value)
+            if len(self._yield_buffer) >= yield_batch_size:
+                self.flush_yields()
+        return self
+
+    def flush_yields(self):
+        batch = self._yield_buffer
+        if batch:
+            self._yield_buffer = None
+            for listener in self.listeners:
+                on_yields = getattr(listener, 'on_yields', None)
+                if on_yields is not None:
+                    on_yields(self, batch)
+                else:
+                    Monitor.on_yields(listener, self, batch)
         return self
 
     def on_success(self, return_value):
-        self.end_time = datetime.datetime.now()
+        if self._yield_buffer is not None:
+            self.flush_yields()
+        self.end_time = _now_ns()
         self.status = Status.Succeed
         self.return_value = return_value
-        self.consumed['outcome.hasSucceeded'] = (self.consumed.get('outcome.hasSucceeded') or 0) + 1
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None:
+        self._counters[Outcome.Succeeded] += 1
+        if self.logger is not None and (self.log_enable is None or self.log_enable()):
+            use_logger = self.logger
             use_logger(self.to_log_line('END   '))
             if self.return_value is not None:
                 use_logger(self.to_log_line('RETURN ', json.dumps(self.return_value, default=str)))
-        for listener in self.listeners:
-            listener.on_success(self)
+        if self.listeners:
+            for listener in self.listeners:
+                listener.on_success(self)
         return self
 
     def on_failure(self, exception):
-        self.end_time = datetime.datetime.now()
+        if self._yield_buffer is not None:
+            self.flush_yields()
+        self.end_time = _now_ns()
         self.status = Status.Fail
         self.exception = exception
-        self.consumed['outcome.hasFailed'] = (self.consumed.get('outcome.hasFailed') or 0) + 1
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None:
+        self._counters[Outcome.Failed] += 1
+        if self.logger is not None and (self.log_enable is None or self.log_enable()):
+            use_logger = self.logger
             if exception is not None:
                 use_logger(self.to_log_line('FAIL  ', str(exception)))
-                use_logger(self.to_log_line('TRACE ', traceback.print_tb(self.exception.__traceback__)))
+                if 'trace' in self.tags:
+                    use_logger(self.to_log_line('TRACE ', ''.join(traceback.format_tb(exception.__traceback__))))
             else:
                 use_logger(self.to_log_line('FAIL  '))
-        for listener in self.listeners:
-            listener.on_failure(self)
+        if self.listeners:
+            for listener in self.listeners:
+                listener.on_failure(self)
         return self
 
     def format(self, json_formatter: typing.Callable[ [typing.Any], typing.Any]):
@@ -279,14 +544,19 @@ class Task:
         self.tags = set(tags)
         return self
 
+    def with_yield_sampling(self, every: typing.Union[int, None]):
+        self._yield_sampling = every
+        return self
+
     def logs(self, logger: typing.Callable[ [str], None], log_enable: typing.Callable[ [], bool ]):
         self.logger = logger
         self.log_enable = log_enable
         return self
 
     def returns(self, args, kwargs, callable: typing.Callable[ [], typing.Any]):
-        self.args = list(args)
-        self.kwargs = kwargs
+        if self.logger is not None or self._wants_args:
+            self.args = list(args)
+            self.kwargs = kwargs
         try:
             self.on_start()
             returned = callable()
@@ -297,14 +567,32 @@ class Task:
             raise err
 
     def generates(self, args, kwargs, callable: typing.Callable[ [], typing.Generator]):
-        self.args = list(args)
-        self.kwargs = kwargs
+        if self.logger is not None or self._wants_args:
+            self.args = list(args)
+            self.kwargs = kwargs
         try:
             self.on_start()
-            for item in callable():
-                self.on_yield(item)
-                yield item
+            if self._yield_sampling is None:
+                for item in callable():
+                    self.on_yield(item)
+                    yield item
+            else:
+                # count every item but only report every Nth one (none if N is 0) to loggers and listeners
+                every = self._yield_sampling
+                count = 0
+                try:
+                    for item in callable():
+                        count += 1
+                        if every and count % every == 0:
+                            self.on_yield(item)
+                        yield item
+                finally:
+                    _inc(self.consumed, 'yields', count)
+            self.on_success(None)
+        except GeneratorExit:
+            # the consumer stopped early, which is not a failure of the task
             self.on_success(None)
+            raise
         except Exception as err:
             self.on_failure(err)            
             raise err
@@ -320,28 +608,34 @@ class Task:
             self.on_success(None)
 
     def info(self, *messages: str):
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None:
+        if self.logger is not None and (self.log_enable is None or self.log_enable()):
+            use_logger = self.logger
             for message in messages:
                 use_logger(self.to_log_line('INFO  ', message))
         return self
 
     def warning(self, *messages: str):
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None:
+        if self.logger is not None and (self.log_enable is None or self.log_enable()):
+            use_logger = self.logger
             for message in messages:
                 use_logger(self.to_log_line('WARN  ', message))
         self.warnings += messages
         return self
 
     def error(self, *messages: str):
-        use_logger = self.logger if (self.log_enable is None or self.log_enable()) else None
-        if use_logger is not None:
+        if self.logger is not None and (self.log_enable is None or self.log_enable()):
+            use_logger = self.logger
             for message in messages:
                 use_logger(self.to_log_line('ERROR ', message))
         self.errors += messages
         return self
 
+    def get_consumed(self) -> typing.Dict[ str, int|float ]:
+        result = dict(self.consumed)
+        for outcome, count in enumerate(self._counters):
+            if count: result[outcome_to_key[outcome]] = count
+        return result
+
     def has_warnings(self):
         return self.warnings is not None and len(self.warnings) > 0
 
@@ -352,10 +646,10 @@ class Task:
         result = {}
         if self.id_ is not None: result['id'] = self.id_
         if self.parent_id is not None: result['parent_id'] = self.parent_id
-        if self.purpose is not None: result['purpose'] = self.purpose
+        if self.purpose is not None: result['purpose'] = str(self.purpose)
         if self.status is not None: result['status'] = self.status
-        if self.start_time is not None: result['start_time'] = str(self.start_time)
-        if self.end_time is not None: result['end_time'] = str(self.end_time)
+        if self.start_time is not None: result['start_time'] = str(_ns_to_datetime(self.start_time))
+        if self.end_time is not None: result['end_time'] = str(_ns_to_datetime(self.end_time))
         result['warnings'] = self.warnings
         result['errors'] = self.errors
         result['args'] = self.args
@@ -369,8 +663,8 @@ class Task:
         self.id_ = obj.get('id')
         self.purpose = obj.get('purpose')
         self.status = obj.get('status')
-        self.start_time = arrow.get(obj.get('start_time')).datetime if 'start_time' in obj else None
-        self.end_time = arrow.get(obj.get('end_time')).datetime if 'end_time' in obj else None
+        self.start_time = _datetime_to_ns(_parse_datetime(obj.get('start_time'))) if 'start_time' in obj else None
+        self.end_time = _datetime_to_ns(_parse_datetime(obj.get('end_time'))) if 'end_time' in obj else None
 
         self.warnings = obj.get('warnings')
         self.errors = obj.get('errors')
@@ -395,42 +689,127 @@ class Task:
             return_value = f"{return_value[0:limit-4]} ..."
         return return_value
 
-def function(parent_: Monitor = None, **deco_kwargs):
-    """Decorate a function as a trackable task"""
+def _notify_skip(listener):
+    # Monitor.on_skip is optional for listeners that do not subclass Monitor
+    on_skip = getattr(listener, 'on_skip', None)
+    if on_skip is not None:
+        on_skip()
+
+def _specialize_function(func, name: str, parent_: typing.Union[Monitor, None], deco_kwargs: typing.Dict[str, typing.Any]):
+    """Compile a wrapper for func with func's own signature, or return None if it cannot be expressed"""
+    try:
+        parameters = list(inspect.signature(func, follow_wrapped=False).parameters.values())
+    except (TypeError, ValueError):
+        return None
+    if any(param.name.startswith('_ci_') for param in parameters):
+        return None
+
+    bindings = {
+        '_ci_func': func,
+        '_ci_name': name,
+        '_ci_parent': parent_,
+        '_ci_module': sys.modules[__name__],
+        '_ci_deco_kwargs': deco_kwargs,
+        '_ci_getframe': sys._getframe,
+        '_ci_Task': Task
+    }
+    signature, positional, keyword, call = [], [], [], []
+    for index, param in enumerate(parameters):
+        if param.kind is param.VAR_POSITIONAL:
+            signature.append(f'*{param.name}')
+            positional.append(f'*{param.name}')
+            call.append(f'*{param.name}')
+            continue
+        if param.kind is param.VAR_KEYWORD:
+            signature.append(f'**{param.name}')
+            keyword.append(f'**{param.name}')
+            call.append(f'**{param.name}')
+            continue
+        if param.kind is param.KEYWORD_ONLY and not any(entry.startswith('*') for entry in signature):
+            signature.append('*')
+        if param.default is param.empty:
+            signature.append(param.name)
+        else:
+            bindings[f'_ci_default_{index}'] = param.default
+            signature.append(f'{param.name}=_ci_default_{index}')
+        if param.kind is param.KEYWORD_ONLY:
+            keyword.append(f'{param.name!r}: {param.name}')
+            call.append(f'{param.name}={param.name}')
+        else:
+            positional.append(param.name)
+            call.append(param.name)
+        if param.kind is param.POSITIONAL_ONLY and (index + 1 == len(parameters) or parameters[index + 1].kind is not param.POSITIONAL_ONLY):
+            signature.append('/')
+
+    parent = '_ci_parent' if parent_ is not None else f'_ci_module.{tally_var_name}'
+    task_kwargs = ', **_ci_deco_kwargs' if deco_kwargs else ''
+    source = (
+        f"def call_function_task({', '.join(signature)}):\n"
+        f"    _ci_caller = _ci_getframe(1)\n"
+        f"    _ci_purpose = '%s.%d: %s' % (_ci_caller.f_code.co_filename.rsplit('/', 1)[-1], _ci_caller.f_lineno, _ci_name)\n"
+        f"    return _ci_Task(_ci_purpose{task_kwargs}).notifies({parent}).returns(({''.join(arg + ', ' for arg in positional)}), {{{', '.join(keyword)}}},\n"
+        f"        lambda: _ci_func({', '.join(call)})\n"
+        f"    )\n"
+    )
+    exec(compile(source, f'<code_instruments function {name}>', 'exec'), bindings)
+    return functools.update_wrapper(bindings['call_function_task'], func)
+
+def function(parent_: Monitor = None, sample_rate: float = 1.0, **deco_kwargs):
+    """Decorate a function as a trackable task, tracking only a sample_rate fraction of calls"""
     def wrap_function(func):
+        name = _func_name(func)
+        if sample_rate >= 1.0:
+            specialized = _specialize_function(func, name, parent_, deco_kwargs)
+            if specialized is not None:
+                return specialized
         @functools.wraps(func)
         def call_function_task(*call_args,**call_kwargs):
-            purpose = str(Call(inspect.currentframe().f_back, func))
             parent = parent_ or __tally__
+            if sample_rate < 1.0 and random.random() >= sample_rate:
+                _notify_skip(parent)
+                return func(*call_args,**call_kwargs)
+            caller = sys._getframe(1)
+            purpose = '%s.%d: %s' % (caller.f_code.co_filename.rsplit('/', 1)[-1], caller.f_lineno, name)
             return Task(purpose,**deco_kwargs).notifies(parent).returns(call_args,call_kwargs,
                 lambda: func(*call_args,**call_kwargs)
             )
         return call_function_task
     return wrap_function
 
-def generator(parent_: Monitor = None, **deco_kwargs):
-    """Decorate a function as a trackable task"""
+def generator(parent_: Monitor = None, sample_rate: float = 1.0, yield_sampling: int = None, **deco_kwargs):
+    """Decorate a function as a trackable task, tracking only a sample_rate fraction of calls
+    and, if yield_sampling is given, reporting only every yield_sampling-th yielded item"""
     def wrap_function(func):
+        name = _func_name(func)
         @functools.wraps(func)
         def call_function_task(*call_args,**call_kwargs):
-            purpose = str(Call(inspect.currentframe().f_back, func))
             parent = parent_ or __tally__
-            return Task(purpose,**deco_kwargs).notifies(parent).generates(call_args,call_kwargs,
+            if sample_rate < 1.0 and random.random() >= sample_rate:
+                _notify_skip(parent)
+                return func(*call_args,**call_kwargs)
+            caller = sys._getframe(1)
+            purpose = '%s.%d: %s' % (caller.f_code.co_filename.rsplit('/', 1)[-1], caller.f_lineno, name)
+            return Task(purpose,**deco_kwargs).with_yield_sampling(yield_sampling).notifies(parent).generates(call_args,call_kwargs,
                 lambda: func(*call_args,**call_kwargs)
             )
         return call_function_task
     return wrap_function
 
-def method(*deco_args,**deco_kwargs):
-    """Decorate a method as a trackable task"""
+def method(*deco_args, sample_rate: float = 1.0, **deco_kwargs):
+    """Decorate a method as a trackable task, tracking only a sample_rate fraction of calls"""
     def wrap_function(func):
+        name = _func_name(func)
         @functools.wraps(func)
         def call_function_task(self, *call_args,**call_kwargs):
-            purpose = str(Call(inspect.currentframe().f_back, func))
             if hasattr(self.__class__, tally_var_name):
                 parent = getattr(self.__class__, tally_var_name)
             else:
                 parent = globals().get(tally_var_name) or __tally__
+            if sample_rate < 1.0 and random.random() >= sample_rate:
+                _notify_skip(parent)
+                return func(self, *call_args,**call_kwargs)
+            caller = sys._getframe(1)
+            purpose = '%s.%d: %s' % (caller.f_code.co_filename.rsplit('/', 1)[-1], caller.f_lineno, name)
             return Task(purpose,*deco_args,**deco_kwargs).notifies(parent).returns(call_args,call_kwargs,
                 lambda: func(self, *call_args,**call_kwargs)
             )
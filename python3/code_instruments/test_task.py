@@ -3,6 +3,8 @@ import json
 import os
 import typing
 import abc
+import functools
+import threading
 
 from . import task
 
@@ -78,8 +80,267 @@ class TestFunction(unittest.TestCase):
         self.assertIsNotNone(__tally__.at_start)
         self.assertEqual(len(result), 3, 'list(function3) should return 3 items!')
         self.assertEqual(len(__tally__.at_yields), 3, 'function3 should yield 3 items!')
+        for at_yield in __tally__.at_yields:
+            self.assertEqual(at_yield['status'], task.Status.Run, 'yields should be reported while the task is still running')
+            self.assertNotIn('end_time', at_yield)
         self.assertIsNotNone(__tally__.at_success)
         self.assertIsNone(__tally__.at_failure)
 
+    def test_outcome_counters(self):
+        tally = task.Tally()
+        with task.Task('counted').notifies(tally):
+            pass
+        self.assertEqual(tally.consumed.get('outcome.hasStarted'), 1)
+        self.assertEqual(tally.consumed.get('outcome.hasSucceeded'), 1)
+        self.assertIsNone(tally.consumed.get('outcome.hasFailed'))
+
+    def test_failure_trace(self):
+        lines = []
+        for tags in [(), ('trace',)]:
+            try:
+                with task.Task('failing').with_tags(*tags).logs(lines.append, None):
+                    raise ValueError('boom')
+            except ValueError:
+                pass
+        traces = [ line for line in lines if 'TRACE' in line ]
+        self.assertEqual(len(traces), 1, 'only the task tagged "trace" should log a traceback')
+        self.assertIn('raise ValueError', traces[0])
+
+    def test_yield_batches(self):
+        class Batches(task.Tally):
+            def __init__(self):
+                super().__init__()
+                self.batches = []
+
+            def on_yields(self, task: task.Task, batch):
+                self.batches.append(list(batch))
+
+        listener = Batches()
+        saved, task.yield_batch_size = task.yield_batch_size, 2
+        try:
+            result = list(task.Task('batched').notifies(listener).generates((), {}, lambda: iter(range(5))))
+        finally:
+            task.yield_batch_size = saved
+        self.assertEqual(result, [0, 1, 2, 3, 4])
+        self.assertEqual(listener.batches, [[0, 1], [2, 3], [4]])
+
+    def test_yield_batches_through_tally(self):
+        class Batches(task.Tally):
+            def __init__(self):
+                super().__init__()
+                self.batches = []
+
+            def on_yields(self, task: task.Task, batch):
+                self.batches.append(len(batch))
+
+        listener = Batches()
+        hub = task.Tally().notifies(listener)
+
+        @task.generator(hub)
+        def count_to(n):
+            yield from range(n)
+
+        self.assertEqual(len(list(count_to(200))), 200)
+        self.assertEqual(listener.batches, [64, 64, 64, 8], 'a Tally should pass whole batches on to its listeners')
+
+    def test_sample_rate(self):
+        tally = task.Tally()
+
+        @task.function(tally, sample_rate=0.0)
+        def never_tracked(a, b):
+            return a+b
+
+        results = [ never_tracked(i, 1) for i in range(10) ]
+        self.assertEqual(results, list(range(1, 11)))
+        self.assertEqual(tally.consumed.get('outcome.hasSkipped'), 10)
+        self.assertIsNone(tally.consumed.get('outcome.hasStarted'))
+
+    def test_sharded_tally(self):
+        tally = task.ShardedTally()
+
+        @task.function(tally)
+        def add(a, b):
+            return a+b
+
+        def work():
+            for i in range(100):
+                add(i, 1)
+
+        threads = [ threading.Thread(target=work) for _ in range(4) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        work()
+        self.assertEqual(len(tally._shards), 5, 'each calling thread should get its own shard')
+        totals = tally.aggregate().consumed
+        self.assertEqual(totals.get('outcome.hasStarted'), 500)
+        self.assertEqual(totals.get('outcome.hasSucceeded'), 500)
+
+    def test_args_capture(self):
+        class ArgsSpy(task.Tally):
+            wants_args = True
+
+        plain = task.Task('plain').notifies(task.Tally())
+        plain.returns((1, 2), {'c': 3}, lambda: None)
+        self.assertIsNone(plain.args)
+        wanting = task.Task('wanting').notifies(ArgsSpy())
+        wanting.returns((1, 2), {'c': 3}, lambda: None)
+        self.assertEqual(wanting.args, [1, 2])
+        self.assertEqual(wanting.kwargs, {'c': 3})
+
+    def test_generator_closed_early(self):
+        tally = Spy()
+
+        @task.generator(tally)
+        def count_to(n):
+            yield from range(n)
+
+        for item in count_to(10):
+            if item == 4:
+                break
+        self.assertEqual(len(tally.at_yields), 5, 'yields seen before the consumer stopped should still be reported')
+        self.assertIsNotNone(tally.at_success, 'a generator closed early should still finish its task')
+        self.assertEqual(len(tally.pending), 0)
+        self.assertEqual(tally.consumed.get('outcome.hasSucceeded'), 1)
+
+    def test_yield_sampling(self):
+        tally = Spy()
+
+        @task.generator(tally, yield_sampling=4)
+        def count_to(n):
+            yield from range(n)
+
+        result = list(count_to(10))
+        self.assertEqual(result, list(range(10)))
+        self.assertEqual(len(tally.at_yields), 2, 'only every 4th of 10 items should be reported')
+        self.assertEqual(tally.consumed.get('yields'), 10)
+
+    def test_specialized_signature(self):
+        tally = task.Tally()
+
+        @task.function(tally)
+        def everything(a, b=2, *args, c, d=4, **kwargs):
+            return (a, b, args, c, d, kwargs)
+
+        self.assertEqual(everything(1, c=3), (1, 2, (), 3, 4, {}))
+        self.assertEqual(everything(1, 5, 6, c=3, d=7, e=8), (1, 5, (6,), 3, 7, {'e': 8}))
+        self.assertEqual(everything.__name__, 'everything')
+        self.assertEqual(tally.consumed.get('outcome.hasSucceeded'), 2)
+
+    def test_logger_attribute(self):
+        lines = []
+        logged = task.Task('logged')
+        logged.logger = lines.append
+        with logged:
+            pass
+        self.assertEqual(len(lines), 2, 'assigning Task.logger directly should enable BEGIN/END lines')
+
+    def test_duck_typed_listener(self):
+        class Recorder:
+            def __init__(self):
+                self.events = []
+
+            def on_start(self, task):
+                self.events.append('start')
+
+            def on_yield(self, task):
+                self.events.append('yield')
+
+            def on_success(self, task):
+                self.events.append('success')
+
+            def on_failure(self, task):
+                self.events.append('failure')
+
+        direct = Recorder()
+        list(task.Task('direct').notifies(direct).generates((), {}, lambda: iter(range(2))))
+        self.assertEqual(direct.events, ['start', 'yield', 'yield', 'success'])
+
+        forwarded = Recorder()
+        tally = task.Tally().notifies(forwarded)
+
+        @task.function(tally, sample_rate=0.0)
+        def skipped():
+            return 1
+
+        with task.Task('forwarded').notifies(tally):
+            pass
+        self.assertEqual(skipped(), 1)
+        self.assertEqual(forwarded.events, ['start', 'success'])
+        self.assertEqual(tally.consumed.get('outcome.hasSkipped'), 1)
+
+    def test_specialized_stacked_decorator(self):
+        def verbose_option(func):
+            @functools.wraps(func)
+            def wrapper(*args, verbose=False, **kwargs):
+                return (func(*args, **kwargs), verbose)
+            return wrapper
+
+        tally = task.Tally()
+
+        @task.function(tally)
+        @verbose_option
+        def add(a, b):
+            return a+b
+
+        self.assertEqual(add(1, 2), (3, False))
+        self.assertEqual(add(1, 2, verbose=True), (3, True))
+        self.assertEqual(tally.consumed.get('outcome.hasSucceeded'), 2)
+
+    def test_listeners_attribute(self):
+        tally = task.Tally()
+        appended = task.Task('appended')
+        appended.listeners.append(tally)
+        with appended:
+            pass
+        self.assertEqual(tally.consumed.get('outcome.hasSucceeded'), 1, 'listeners appended directly to Task.listeners should be notified')
+
+    def test_json_round_trip(self):
+        original = task.Task('timed')
+        with original:
+            pass
+        copy = task.Task()
+        copy.from_json(original.to_json())
+        self.assertEqual(copy.id_, original.id_)
+        self.assertLess(abs(copy.start_time - original.start_time), 1000, 'start_time should survive to_json/from_json to the microsecond')
+        self.assertLess(abs(copy.end_time - original.end_time), 1000, 'end_time should survive to_json/from_json to the microsecond')
+
+        aware = task.Task()
+        aware.from_json({ 'start_time': '2026-01-01T12:00:00+00:00' })
+        self.assertAlmostEqual(task._ns_to_datetime(aware.start_time).timestamp(), 1767268800.0, 3, 'an explicit UTC offset should be honoured')
+
+    def test_tally_listeners_assignment(self):
+        listener = Spy()
+        tally = task.Tally()
+        tally.listeners = [listener]
+        with task.Task('assigned').notifies(tally):
+            pass
+        self.assertIsNotNone(listener.at_success, 'listeners assigned to Tally.listeners should be notified')
+        with self.assertRaises(AttributeError):
+            tally.listeners.append(Spy())
+
+    def test_args_capture_through_tally(self):
+        class ArgsRecorder(task.Tally):
+            wants_args = True
+
+            def __init__(self):
+                super().__init__()
+                self.seen = []
+
+            def on_start(self, task: task.Task):
+                self.seen.append((task.args, task.kwargs))
+
+        for hub in [task.Tally(), task.ShardedTally()]:
+            recorder = ArgsRecorder()
+            hub.notifies(recorder)
+
+            @task.function(hub)
+            def add(a, b):
+                return a+b
+
+            add(1, 2)
+            self.assertEqual(recorder.seen, [([1, 2], {})], f'{type(hub).__name__} listeners asking for args should get them')
+
 if __name__ == '__main__':
     unittest.main()